@@ -54,6 +54,7 @@ class Options(OptionCategory):
                      type="choice", choices=["default", "dilated", "none"])
         g.add_option("--basil-options", "--fit-options", help="File containing additional options for Basil model fitting", type="optfile", default=None)
         g.add_option("--basil-method", help="Model fitting method", type="choice", choices=["fabber", "vaby", "svb"])
+        g.add_option("--basil-chunks", help="Number of subsets of the mask to fit in parallel for non-spatial Fabber steps", type=int)
         ret.append(g)
 
         g = OptionGroup(parser, "BASIL partial volume correction (PVEc)")
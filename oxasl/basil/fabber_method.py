@@ -11,13 +11,9 @@ import numpy as np
 from fsl.data.image import Image
 
 from oxasl import mask, reg
+from oxasl.utils import get_plugin
 from . import multistep_fit
 
-try:
-    import oxasl_surfpvc
-except ImportError:
-    oxasl_surfpvc = None
-
 def run(wsp):
     # Basic non-PVC run
     multistep_fit.run(wsp.sub("basil"))
@@ -41,10 +37,7 @@ def run(wsp):
     if wsp.pvcorr or wsp.surf_pvcorr or wsp.user_pv_flag:
         # Partial volume correction is very sensitive to the mask, so recreate it
         # if it came from the structural image as this requires accurate ASL->Struc registration
-        if wsp.rois.mask_src == "struc":
-            wsp.rois.mask_orig = wsp.rois.mask
-            wsp.rois.mask = None
-            mask.run(wsp)
+        mask.update_struc_mask(wsp)
 
         if wsp.pvcorr or wsp.user_pv_flag:
             _default_pvcorr(wsp)
@@ -64,8 +57,7 @@ def _default_pvcorr(wsp):
         wsp.structural.wm_pv_asl = wsp.pvwm
         wsp.structural.gm_pv_asl = wsp.pvgm
     elif wsp.structural.struc is not None:
-        wsp.structural.wm_pv_asl = reg.change_space(wsp, wsp.structural.wm_pv, "asl")
-        wsp.structural.gm_pv_asl = reg.change_space(wsp, wsp.structural.gm_pv, "asl")
+        wsp.structural.wm_pv_asl, wsp.structural.gm_pv_asl = reg.change_space_multi(wsp, [wsp.structural.wm_pv, wsp.structural.gm_pv], "asl")
     else:
         raise RuntimeError("Can't do partial volume correction without either user PV estimates or structural image")
 
@@ -76,6 +68,7 @@ def _default_pvcorr(wsp):
     wsp.quantify_wsps.append("basil_pvcorr")
 
 def _surf_pvcorr(wsp):
+    oxasl_surfpvc = get_plugin("oxasl_surfpvc")
     if oxasl_surfpvc is None:
         raise RuntimeError("Surface-based PVC requested but oxasl_surfpvc is not installed")
     if wsp.user_pv_flag:
@@ -3,8 +3,12 @@ OXASL: Multi-step Bayesian model fitting for ASL data
 
 Based on the BASIL shell command from FSL
 """
+import os
 import sys
 import math
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import scipy.ndimage
@@ -13,13 +17,56 @@ from fsl.wrappers import LOAD
 from fsl.data.image import Image
 
 from oxasl import __version__, __timestamp__, reg
+from oxasl.wrappers import fabber, mvntool
+
+# Model fitting options common to all non-spatial VB runs
+_VB_OPTIONS = {
+    "method" : "vb",
+    "noise" : "white",
+    "allow-bad-voxels" : True,
+    "max-iterations" : 20,
+    "convergence" : "trialmode",
+    "max-trials" : 10,
+    "save-mean" : True,
+    "save-mvn" : True,
+    "save-std" : True,
+    "save-model-fit" : True,
+}
+
+# Model fitting options for the final spatial VB step
+_SPATIAL_OPTIONS = {
+    "method" : "spatialvb",
+    "param-spatial-priors" : "N+",
+    "convergence" : "maxits",
+    "max-iterations": 20,
+}
+
+# Default tissue T1 and BAT for white paper mode, CASL and PASL data
+_T1_BAT_DEFAULTS = {
+    "wp" : (1.65, 0.0),
+    "casl" : (1.3, 1.3),
+    "pasl" : (1.3, 0.7),
+}
+
+# Workspace inference flags and the model option which includes the corresponding
+# parameter in the model
+_INCLUDE_OPTIONS = (
+    ("infertiss", "inctiss"),
+    ("inferbat", "incbat"),
+    ("inferart", "incart"),
+    ("inferpc", "incpc"),
+    ("infertau", "inctau"),
+    ("infert1", "inct1"),
+)
 
 def run(wsp, prefit=True, **kwargs):
     """
     Run multi-step model fitting on ASL data in a workspace
 
     :param wsp: Workspace object
-    :param prefit: If True, run a pre-fitting step using the mean over repeats of the ASL data
+    :param prefit: If True, run a pre-fitting step using the mean over repeats of the ASL data.
+                   This is skipped if an initial MVN is supplied in ``initmvn`` as the
+                   prefit output would only be used to initialize the main run
 
     Required workspace attributes
     -----------------------------
@@ -43,10 +90,11 @@ def run(wsp, prefit=True, **kwargs):
      - ``t1im`` : T1 map as Image
      - ``pgm`` :  Grey matter partial volume map as Image
      - ``pwm`` : White matter partial volume map as Image
-     - ``initmvn`` : MVN structure to use as initialization as Image
+     - ``initmvn`` : MVN structure to use as initialization as Image. If specified, no prefit is performed
      - ``spatial`` : If True, include final spatial VB step (default: False)
      - ``onestep`` : If True, do all inference in a single step (default: False)
      - ``basil_options`` : Optional dictionary of additional options for underlying model
+     - ``basil_chunks`` : Number of subsets of the mask to fit in parallel for non-spatial Fabber steps (default: 1)
     """
     wsp.log.write("\nRunning BASIL Bayesian modelling on ASL data in '%s' data space\n" % wsp.ifnone("image_space", "asl"))
 
@@ -55,7 +103,7 @@ def run(wsp, prefit=True, **kwargs):
     _define_mask(wsp)
 
     # Do pre-fit on averaged data if requested
-    if prefit and max(wsp.asldata.rpts) > 1:
+    if prefit and max(wsp.asldata.rpts) > 1 and wsp.initmvn is None:
         wsp.log.write(" - Doing initial fit on mean at each TI\n\n")
         init_wsp = wsp.sub("init")
         main_wsp = wsp.sub("main")
@@ -87,25 +135,22 @@ def _set_defaults(wsp):
         # White paper mode - this overrides defaults, but can be overwritten by command line
         # specification of individual parameters
         wsp.log.write(" - Analysis in white paper mode: T1 default=1.65, BAT default=0, voxelwise calibration\n")
-        t1_default = 1.65
-        bat_default = 0.0
+        t1_default, bat_default = _T1_BAT_DEFAULTS["wp"]
+    elif wsp.asldata.casl:
+        t1_default, bat_default = _T1_BAT_DEFAULTS["casl"]
     else:
-        t1_default = 1.3
-        if wsp.asldata.casl:
-            bat_default = 1.3
-        else:
-            bat_default = 0.7
-
-    if wsp.t1 is None:
-        wsp.t1 = t1_default
-    if wsp.t1b is None:
-        wsp.t1b = 1.65
-    if wsp.bat is None:
-        wsp.bat = bat_default
-    if wsp.batsd is None:
-        wsp.batsd = batsd_default
-    if wsp.infertiss is None:
-        wsp.infertiss = True
+        t1_default, bat_default = _T1_BAT_DEFAULTS["pasl"]
+
+    defaults = (
+        ("t1", t1_default),
+        ("t1b", 1.65),
+        ("bat", bat_default),
+        ("batsd", batsd_default),
+        ("infertiss", True),
+    )
+    for attr, default in defaults:
+        if getattr(wsp, attr) is None:
+            setattr(wsp, attr, default)
 
     # if we are doing CASL then fix the bolus duration, unless explicitly told us otherwise
     if wsp.infertau is None:
@@ -157,34 +202,46 @@ def run_multistep_fitting(wsp, asldata):
     :param wsp: Workspace object
     :param asldata: AslImage object to use as input data
     """
+    if asldata is None:
+        raise ValueError("Input ASL data is None")
+
+    # Difference the data once here and share it with the step generation
+    # rather than differencing the full data set twice
+    asldata_diff = asldata.diff().reorder("rt")
     if len(asldata.tes) > 1:
-        steps = fitting_steps_multite(wsp, asldata)
+        steps = fitting_steps_multite(wsp, asldata, asldata_diff=asldata_diff)
     else:
-        steps = fitting_steps(wsp, asldata)
+        steps = fitting_steps(wsp, asldata, asldata_diff=asldata_diff)
 
     prev_result = None
-    wsp.asldata_diff = asldata.diff().reorder("rt")
-
-    for idx, step in enumerate(steps):
-        step_wsp = wsp.sub("step%i" % (idx+1))
-        desc = "Step %i of %i: %s" % (idx+1, len(steps), step.desc)
-        if prev_result is not None:
-            desc += " - Initialise with step %i" % idx
-        step_wsp.log.write(desc + "     ")
-        result = step.run(prev_result, log=wsp.log, fsllog=wsp.fsllog)
-        for key, value in result.items():
-            if key == "modelfit":
-                # Treat model fit specially - make it an AslImage and also output a mean
-                # across repeats version for comparison
-                value = wsp.asldata_diff.derived(value.data, header=value.header)
-                modelfit_mean = value.mean_across_repeats()
-                setattr(step_wsp, "modelfit_mean", modelfit_mean)
-            setattr(step_wsp, key, value)
-
-        if step_wsp.logfile is not None and step_wsp.savedir is not None:
-            step_wsp.set_item("logfile", step_wsp.logfile, save_fn=str)
-
-        prev_result = result
+    wsp.asldata_diff = asldata_diff
+
+    # Input images shared between steps are saved to this directory once rather
+    # than being written to temporary files for every step
+    input_files = ImageFiles()
+    try:
+        for idx, step in enumerate(steps):
+            step_wsp = wsp.sub("step%i" % (idx+1))
+            desc = "Step %i of %i: %s" % (idx+1, len(steps), step.desc)
+            if prev_result is not None:
+                desc += " - Initialise with step %i" % idx
+            step_wsp.log.write(desc + "     ")
+            result = step.run(prev_result, log=wsp.log, fsllog=wsp.fsllog, input_files=input_files)
+            for key, value in result.items():
+                if key == "modelfit":
+                    # Treat model fit specially - make it an AslImage and also output a mean
+                    # across repeats version for comparison
+                    value = asldata_diff.derived(value.data, header=value.header)
+                    modelfit_mean = value.mean_across_repeats()
+                    setattr(step_wsp, "modelfit_mean", modelfit_mean)
+                setattr(step_wsp, key, value)
+
+            if step_wsp.logfile is not None and step_wsp.savedir is not None:
+                step_wsp.set_item("logfile", step_wsp.logfile, save_fn=str)
+
+            prev_result = result
+    finally:
+        input_files.cleanup()
     wsp.finalstep = step_wsp
     wsp.log.write("\nEnd\n")
 
@@ -215,7 +272,7 @@ def _handle_slicedt(wsp, options):
 
         options["tiimg"] = wsp.tiimg
 
-def fitting_steps(wsp, asldata):
+def fitting_steps(wsp, asldata, asldata_diff=None):
     """
     Get the steps required for a BASIL run
 
@@ -224,34 +281,33 @@ def fitting_steps(wsp, asldata):
     an actual run.
 
     Arguments are the same as the ``basil`` function. No workspace is required.
+
+    :param asldata_diff: Optional differenced data in 'rt' order if this has
+                         already been generated from ``asldata``
     """
     if asldata is None:
         raise ValueError("Input ASL data is None")
 
     wsp.log.write("BASIL v%s\n" % __version__)
     asldata.summary(log=wsp.log)
-    asldata = asldata.diff().reorder("rt")
+    if asldata_diff is None:
+        asldata_diff = asldata.diff().reorder("rt")
+    asldata = asldata_diff
+
+    # Images converted to the quantification space, shared between steps
+    converted = {}
 
     # Default model fitting options for VB runs and spatial steps. Note that values
     # could are None (e.g. sliceband) - these will not be passed to the model fitting step
-    options = {
+    options = dict(_VB_OPTIONS)
+    options.update({
         "data" : asldata,
         "model" : "aslrest",
         "disp" : "none",
         "exch" : "mix",
-        "method" : "vb",
-        "noise" : "white",
-        "allow-bad-voxels" : True,
-        "max-iterations" : 20,
-        "convergence" : "trialmode",
-        "max-trials" : 10,
-        "save-mean" : True,
-        "save-mvn" : True,
-        "save-std" : True,
         "save-noise-mean" : True,
-        "save-model-fit" : True,
         "save-residuals" : wsp.ifnone("output_residuals", False),
-    }
+    })
 
     if wsp.basil_mask is not None:
         options["mask"] = wsp.basil_mask
@@ -307,12 +363,7 @@ def fitting_steps(wsp, asldata):
     # Options for final spatial step
     prior_type_spatial = "M"
     prior_type_mvs = "A"
-    options_svb = {
-        "method" : "spatialvb",
-        "param-spatial-priors" : "N+",
-        "convergence" : "maxits",
-        "max-iterations": 20,
-    }
+    options_svb = dict(_SPATIAL_OPTIONS)
 
     wsp.log.write("Model: %s\n" % options["model"])
     wsp.log.write("Dispersion model: %s\n" % options["disp"])
@@ -335,29 +386,15 @@ def fitting_steps(wsp, asldata):
         # Ignore partial volumes below 0.1
         pgm_img = options.pop("pgm")
         pwm_img = options.pop("pwm")
-        pgm = np.copy(pgm_img.data)
-        pwm = np.copy(pwm_img.data)
-        pgm[pgm < 0.1] = 0
-        pgm[pgm > 1] = 1
-        pwm[pwm < 0.1] = 0
-        pwm[pwm > 1] = 1
-        pgm = Image(pgm, header=pgm_img.header)
-        pwm = Image(pwm, header=pwm_img.header)
+        pgm = Image(_threshold_pv(pgm_img.data), header=pgm_img.header)
+        pwm = Image(_threshold_pv(pwm_img.data), header=pwm_img.header)
 
     # Set general parameter inference and inclusion
-    if wsp.infertiss:
-        options["inctiss"] = True
+    for infer_attr, inc_option in _INCLUDE_OPTIONS:
+        if getattr(wsp, infer_attr):
+            options[inc_option] = True
     if wsp.inferbat:
-        options["incbat"] = True
         options["inferbat"] = True # Infer in first step
-    if wsp.inferart:
-        options["incart"] = True
-    if wsp.inferpc:
-        options["incpc"] = True
-    if wsp.infertau:
-        options["inctau"] = True
-    if wsp.infert1:
-        options["inct1"] = True
 
     # Keep track of the number of spatial priors specified by name
     spriors = 1
@@ -385,9 +422,8 @@ def fitting_steps(wsp, asldata):
     if wsp.infertiss:
         components += " Tissue "
         options["infertiss"] = True
-        step_desc = "VB - %s" % components
         if not wsp.onestep:
-            steps.append(FittingStep(wsp, options, step_desc))
+            steps.append(FittingStep(wsp, options, "VB - %s" % components, converted=converted))
 
         # setup spatial priors ready
         spriors = _add_prior(options_svb, spriors, "ftiss", type=prior_type_spatial)
@@ -396,9 +432,8 @@ def fitting_steps(wsp, asldata):
     if wsp.inferart:
         components += " Arterial "
         options["inferart"] = True
-        step_desc = "VB - %s" % components
         if not wsp.onestep:
-            steps.append(FittingStep(wsp, options, step_desc))
+            steps.append(FittingStep(wsp, options, "VB - %s" % components, converted=converted))
 
         # setup spatial priors ready
         spriors = _add_prior(options_svb, spriors, "fblood", type=prior_type_mvs)
@@ -407,9 +442,8 @@ def fitting_steps(wsp, asldata):
     if wsp.infertau:
         components += " Bolus duration "
         options["infertau"] = True
-        step_desc = "VB - %s" % components
         if not wsp.onestep:
-            steps.append(FittingStep(wsp, options, step_desc))
+            steps.append(FittingStep(wsp, options, "VB - %s" % components, converted=converted))
 
     ### --- MODEL EXTENSIONS MODULE ---
     # Add variable dispersion and/or exchange parameters and/or pre-capiliary
@@ -424,17 +458,15 @@ def fitting_steps(wsp, asldata):
             components += " pre-capiliary"
             options["inferpc"] = True
 
-        step_desc = "VB - %s" % components
         if not wsp.onestep:
-            steps.append(FittingStep(wsp, options, step_desc))
+            steps.append(FittingStep(wsp, options, "VB - %s" % components, converted=converted))
 
     ### --- T1 MODULE ---
     if wsp.infert1:
         components += " T1 "
         options["infert1"] = True
-        step_desc = "VB - %s" % components
         if not wsp.onestep:
-            steps.append(FittingStep(wsp, options, step_desc))
+            steps.append(FittingStep(wsp, options, "VB - %s" % components, converted=converted))
 
     ### --- PV CORRECTION MODULE ---
     if pvcorr:
@@ -449,27 +481,29 @@ def fitting_steps(wsp, asldata):
 
         if steps:
             # Add initialisaiton step for PV correction - ONLY if we have something to init from
-            steps.append(PvcInitStep(wsp, {"data" : asldata, "mask" : wsp.basil_mask, "pgm" : pgm, "pwm" : pwm}, "PVC initialisation"))
+            steps.append(PvcInitStep(wsp, {"data" : asldata, "mask" : wsp.basil_mask, "pgm" : pgm, "pwm" : pwm}, "PVC initialisation", converted=converted))
 
     ### --- SPATIAL MODULE ---
     if wsp.spatial:
-        step_desc = "Spatial VB - %s" % components
         options.update(options_svb)
         del options["max-trials"]
 
         if not wsp.onestep:
-            steps.append(FittingStep(wsp, options, step_desc))
+            steps.append(FittingStep(wsp, options, "Spatial VB - %s" % components, converted=converted))
 
     ### --- SINGLE-STEP OPTION ---
-    if wsp.onestep:
-        steps.append(FittingStep(wsp, options, step_desc))
+    # This is the only step added in single-step mode. If spatial inference
+    # was requested the spatial options have already been merged into it
+    if wsp.onestep and (components or wsp.spatial):
+        step_desc = "%s - %s" % ("Spatial VB" if wsp.spatial else "VB", components)
+        steps.append(FittingStep(wsp, options, step_desc, converted=converted))
 
     if not steps:
         raise ValueError("No steps were generated - no parameters were set to be inferred")
 
     return steps
 
-def fitting_steps_multite(wsp, asldata, **kwargs):
+def fitting_steps_multite(wsp, asldata, asldata_diff=None, **kwargs):
     """
     Get the steps required for a BASIL run on multi-TE data
 
@@ -484,24 +518,20 @@ def fitting_steps_multite(wsp, asldata, **kwargs):
 
     wsp.log.write("BASIL v%s\n" % __version__)
     asldata.summary(log=wsp.log)
-    asldata = asldata.diff().reorder("rt")
+    if asldata_diff is None:
+        asldata_diff = asldata.diff().reorder("rt")
+    asldata = asldata_diff
+
+    # Images converted to the quantification space, shared between steps
+    converted = {}
 
     # Default model fitting options for VB runs and spatial steps.
-    options = {
+    options = dict(_VB_OPTIONS)
+    options.update({
         "data" : asldata,
         "model" : "asl_multite",
-        "method" : "vb",
-        "noise" : "white",
-        "allow-bad-voxels" : True,
-        "max-iterations" : 20,
-        "convergence" : "trialmode",
-        "max-trials" : 10,
-        "save-mean" : True,
-        "save-mvn" : True,
-        "save-std" : True,
-        "save-model-fit" : True,
         "mask" : wsp.basil_mask,
-    }
+    })
 
     # We choose to pass TIs (not PLDs). The asldata object ensures that
     # TIs are correctly derived from PLDs, when these are specified, by adding
@@ -544,12 +574,7 @@ def fitting_steps_multite(wsp, asldata, **kwargs):
     # Options for final spatial step
     prior_type_spatial = "M"
     prior_type_mvs = "A"
-    options_svb = {
-        "method" : "spatialvb",
-        "param-spatial-priors" : "N+",
-        "convergence" : "maxits",
-        "max-iterations": 20,
-    }
+    options_svb = dict(_SPATIAL_OPTIONS)
 
     wsp.log.write("Model: %s\n" % options["model"])
     
@@ -605,78 +630,208 @@ def fitting_steps_multite(wsp, asldata, **kwargs):
             components += " Exchange time"
             options["infertexch"] = True
 
-        step_desc = "VB - %s" % components
         if not wsp.onestep:
-            steps.append(FittingStep(wsp, options, step_desc))
+            steps.append(FittingStep(wsp, options, "VB - %s" % components, converted=converted))
 
         # Setup spatial priors ready
         spriors = _add_prior(options_svb, spriors, "ftiss", type=prior_type_spatial)
 
     ### --- SPATIAL MODULE ---
     if wsp.spatial:
-        step_desc = "Spatial VB - %s" % components
         options.update(options_svb)
         del options["max-trials"]
 
         if not wsp.onestep:
-            steps.append(FittingStep(wsp, options, step_desc))
+            steps.append(FittingStep(wsp, options, "Spatial VB - %s" % components, converted=converted))
 
     ### --- SINGLE-STEP OPTION ---
-    if wsp.onestep:
-        steps.append(FittingStep(wsp, options, step_desc))
+    # This is the only step added in single-step mode. If spatial inference
+    # was requested the spatial options have already been merged into it
+    if wsp.onestep and (components or wsp.spatial):
+        step_desc = "%s - %s" % ("Spatial VB" if wsp.spatial else "VB", components)
+        steps.append(FittingStep(wsp, options, step_desc, converted=converted))
 
     if not steps:
         raise ValueError("No steps were generated - no parameters were set to be inferred")
 
     return steps
 
+def _threshold_pv(pv):
+    """
+    Zero partial volumes below 0.1 and limit to a maximum of 1
+    """
+    return np.where(pv < 0.1, 0, np.minimum(pv, 1))
+
 def _list_option(options, values, name):
-    for idx, value in enumerate(values):
-        options["%s%i" % (name, idx+1)] = value
+    options.update(("%s%i" % (name, idx+1), value) for idx, value in enumerate(values))
 
 def _add_prior(options, prior_idx, param, **kwargs):
-    options["PSP_byname%i" % prior_idx] = param
-    for key, value in kwargs.items():
-        options["PSP_byname%i_%s" % (prior_idx, key)] = value
+    prefix = "PSP_byname%i" % prior_idx
+    options[prefix] = param
+    options.update((prefix + "_" + key, value) for key, value in kwargs.items())
     return prior_idx + 1
 
+def _spatial_priors(options):
+    """
+    Get the non-image priors specified by name in Fabber options
+
+    :return: Mapping from parameter name to a dictionary containing its prior type
+    """
+    priors = {}
+    prior_idx = 1
+    while "PSP_byname%i" % prior_idx in options:
+        prefix = "PSP_byname%i" % prior_idx
+        prior_type = options.get(prefix + "_type", None)
+        if prior_type is not None and prior_type != "I":
+            priors[options[prefix]] = {"prior_type" : prior_type}
+        prior_idx += 1
+    return priors
+
+def _fabber_chunked(options, nchunks, progress_log=None, **kwargs):
+    """
+    Run Fabber in parallel on separate subsets of the voxels in the mask
+
+    This is only valid for non-spatial inference. Fabber is run as an external
+    process so threads are sufficient to run the chunks concurrently.
+
+    :param options: Fabber options including a ``mask`` Image
+    :param nchunks: Number of subsets to divide the masked voxels into
+    :param progress_log: Stream to log progress to. Only the first chunk reports progress
+    :return: Fabber output dictionary with the output images of each chunk combined
+    """
+    mask_img = options["mask"]
+    if not isinstance(mask_img, Image):
+        mask_img = Image(mask_img)
+    voxels = np.flatnonzero(mask_img.data)
+    chunk_masks = []
+    for chunk_voxels in np.array_split(voxels, nchunks):
+        if chunk_voxels.size > 0:
+            chunk_mask = np.zeros(mask_img.shape[:3], dtype=bool)
+            chunk_mask.flat[chunk_voxels] = True
+            chunk_masks.append(chunk_mask)
+
+    if len(chunk_masks) < 2:
+        # Nothing to divide up, e.g. if the mask is empty or contains a single voxel
+        return fabber(options, output=LOAD, progress_log=progress_log, **kwargs)
+
+    def _run_chunk(idx):
+        chunk_options = dict(options)
+        chunk_options["mask"] = Image(chunk_masks[idx].astype(np.int8), header=mask_img.header)
+        return fabber(chunk_options, output=LOAD, progress_log=progress_log if idx == 0 else None, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=len(chunk_masks)) as executor:
+        results = list(executor.map(_run_chunk, range(len(chunk_masks))))
+
+    ret = dict(results[0])
+    for key, value in ret.items():
+        if isinstance(value, Image):
+            data = np.zeros(value.shape, dtype=value.data.dtype)
+            for chunk_mask, result in zip(chunk_masks, results):
+                data[chunk_mask] = result[key].data[chunk_mask]
+            ret[key] = Image(data, header=value.header)
+    ret["logfile"] = "\n".join([result["logfile"] for result in results])
+    return ret
+
+class ImageFiles(object):
+    """
+    Input images saved to files in a temporary directory
+
+    This is used to save images which are used by multiple fitting steps once,
+    rather than each Fabber run writing its own temporary copy
+    """
+    def __init__(self):
+        self._dir = None
+        self._files = {}
+
+    def filename(self, img):
+        """
+        :param img: Image
+        :return: Filename of the saved image, saving it if not already saved
+        """
+        saved = self._files.get(id(img), None)
+        if saved is None or saved[0] is not img:
+            if self._dir is None:
+                self._dir = tempfile.mkdtemp(prefix="oxasl_basil")
+            fname = os.path.join(self._dir, "input%i.nii" % len(self._files))
+            img.nibImage.to_filename(fname)
+            saved = (img, fname)
+            self._files[id(img)] = saved
+        return saved[1]
+
+    def cleanup(self):
+        """
+        Remove all saved files
+        """
+        if self._dir is not None:
+            shutil.rmtree(self._dir)
+        self._dir = None
+        self._files = {}
+
 class Step(object):
     """
     A step in the fitting process
+
+    The options are copied as the options used to generate the steps are modified
+    after each step is created
     """
-    def __init__(self, wsp, options, desc):
+    def __init__(self, wsp, options, desc, converted=None):
+        """
+        :param converted: Optional dictionary of images which have already been converted
+                          to the quantification space. Converted images are added to it
+                          so they can be re-used by other steps
+        """
         self.options = dict(options)
         self.desc = desc
-        # Need to convert all images to quantification image space
-        for key in list(options.keys()):
-            poss_img = self.options[key]
+        # Need to convert all images to quantification image space. Images which have
+        # already been converted for a previous step are re-used rather than
+        # transformed again
+        image_space = wsp.ifnone("image_space", "asl")
+        if converted is None:
+            converted = {}
+        for key, poss_img in self.options.items():
             if isinstance(poss_img, Image):
-                image_space = wsp.ifnone("image_space", "asl")
-                self.options[key] = reg.change_space(wsp, poss_img, image_space, mask=(key == 'mask'))
+                is_mask = key == 'mask'
+                cached = converted.get((id(poss_img), is_mask), None)
+                if cached is None or cached[0] is not poss_img:
+                    cached = (poss_img, reg.change_space(wsp, poss_img, image_space, mask=is_mask))
+                    converted[(id(poss_img), is_mask)] = cached
+                self.options[key] = cached[1]
 
 class FittingStep(Step):
     """
     A step which fits a model to the data
     """
-    def __init__(self, wsp, options, desc):
-        Step.__init__(self, wsp, options, desc)
+    def __init__(self, wsp, options, desc, converted=None):
+        Step.__init__(self, wsp, options, desc, converted)
         self._impl = wsp.ifnone("basil_method", "fabber")
+        self._nchunks = wsp.ifnone("basil_chunks", 1)
 
-    def run(self, prev_output, log=sys.stdout, fsllog=None, **kwargs):
+    def run(self, prev_output, log=sys.stdout, fsllog=None, input_files=None, **kwargs):
         """
-        Run model fitting (fabber or vaby), initialising it from the output of a previous step
+        Run model fitting (fabber, vaby or svb), initialising it from the output of a previous step
+
+        :param input_files: Optional ImageFiles instance used to save input images which
+                            are shared with other steps
         """
         if prev_output is not None:
             self.options["continue-from-mvn"] = prev_output["finalMVN"]
         if self._impl == "fabber":
-            from oxasl.wrappers import fabber
             fabber_options = dict(self.options)
             for k, v in self.options.items():
                 if isinstance(v, list):
                     fabber_options.pop(k)
                     _list_option(fabber_options, v, k[:-1])
-            ret = fabber(fabber_options, output=LOAD, progress_log=log, log=fsllog, **kwargs)
-        elif self._impl == "vaby":
+                elif input_files is not None and isinstance(v, Image) and k != "continue-from-mvn":
+                    # The initial MVN is different for each step so there is no benefit in saving it
+                    fabber_options[k] = input_files.filename(v)
+            # Without spatial priors each voxel is fitted independently so
+            # the mask can be divided up and the subsets fitted in parallel
+            if self._nchunks > 1 and fabber_options["method"] != "spatialvb" and fabber_options.get("mask", None) is not None:
+                ret = _fabber_chunked(fabber_options, self._nchunks, progress_log=log, log=fsllog, **kwargs)
+            else:
+                ret = fabber(fabber_options, output=LOAD, progress_log=log, log=fsllog, **kwargs)
+        elif self._impl in ("vaby", "svb"):
+            # SVB uses the vaby framework with stochastic rather than analytic VB
             import vaby
             vaby_options = {}
             for k, v in self.options.items():
@@ -685,9 +840,13 @@ class FittingStep(Step):
                     v = v.nibImage
                 vaby_options[k] = v
             vaby_options["model_name"] = vaby_options.pop("model")
-            vaby_options["initial_posterior"] = vaby_options.pop("continue-from-mvn", None)
+            vaby_options["initial_posterior"] = vaby_options.pop("continue_from_mvn", None)
             vaby_options["repeats"] = vaby_options.pop("rpts", None)
-            vaby_options["method"] = "avb"
+            if vaby_options.pop("method", None) == "spatialvb":
+                # There is no separate spatial method - spatial priors are instead
+                # given as the prior type of each parameter
+                vaby_options["param_overrides"] = _spatial_priors(self.options)
+            vaby_options["method"] = "avb" if self._impl == "vaby" else "svb"
             vaby_options["save_posterior"] = True
             output = {}
             _runtime, _state = vaby.run(outdict=output, **vaby_options)
@@ -716,16 +875,25 @@ class PvcInitStep(Step):
         # set the inital GM amd WM values using a simple PV correction
         wm_cbf_ratio = 0.4
 
-        # Modified pvgm map
-        temp_pgm = np.copy(self.options["pgm"].data)
-        temp_pgm[temp_pgm < 0.2] = 0.2
-
-        # First part of correction psuedo WM CBF term
-        prev_ftiss = prev_output["mean_ftiss"].data
-        wm_cbf_term = (prev_ftiss * wm_cbf_ratio) * self.options["pwm"].data
-
-        gmcbf_init = (prev_ftiss - wm_cbf_term) / temp_pgm
-        wmcbf_init = gmcbf_init * wm_cbf_ratio
+        # GM CBF is the tissue CBF with the psuedo WM CBF term removed, divided by
+        # a modified pvgm map. Only voxels within the mask are used by the MVN
+        # update so we only calculate the initial values for these voxels. The
+        # arithmetic is done in place to avoid allocating a temporary for each
+        # intermediate term
+        inmask = self.options["mask"].data != 0
+        pgm = self.options["pgm"].data[inmask]
+        pwm = self.options["pwm"].data[inmask]
+        prev_ftiss = prev_output["mean_ftiss"].data[inmask]
+        gmcbf_masked = pwm * -wm_cbf_ratio
+        gmcbf_masked += 1
+        gmcbf_masked *= prev_ftiss
+        # Masked arrays are copies so the pvgm map can safely be modified in place
+        gmcbf_masked /= np.clip(pgm, 0.2, None, out=pgm)
+
+        gmcbf_init = np.zeros(inmask.shape, dtype=gmcbf_masked.dtype)
+        gmcbf_init[inmask] = gmcbf_masked
+        wmcbf_init = np.zeros(inmask.shape, dtype=gmcbf_masked.dtype)
+        wmcbf_init[inmask] = gmcbf_masked * wm_cbf_ratio
 
         mvn = prev_output["finalMVN"]
         gmcbf_init = Image(gmcbf_init, header=mvn.header)
@@ -737,7 +905,6 @@ class PvcInitStep(Step):
 
         # load these into the MVN
         mvn = prev_output["finalMVN"]
-        from oxasl.wrappers import mvntool
         params = prev_output["paramnames"]
         mvn = mvntool(mvn, params.index("ftiss")+1, output=LOAD, mask=mask, write=True, valim=gmcbf_init, var=0.1, log=fsllog)["output"]
         mvn = mvntool(mvn, params.index("fwm")+1, output=LOAD, mask=mask, write=True, valim=wmcbf_init, var=0.1, log=fsllog)["output"]
@@ -1,8 +1,14 @@
 """
 OXASL - Quantification using SVB (Stochastic VB)
 
+This uses the stochastic VB method from the vaby framework. Like the vaby
+method this does not yet support PVC
+
 Copyright (c) 2008-2020 Univerisity of Oxford
 """
+from . import multistep_fit
 
 def run(wsp):
-    raise NotImplementedError("SVB quantification not yet implemented")
+    # Basic non-PVC run
+    multistep_fit.run(wsp.sub("basil"), impl="svb")
+    wsp.quantify_wsps.append("basil")
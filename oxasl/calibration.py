@@ -22,14 +22,14 @@ class Options(OptionCategory):
         groups = []
         return groups
 
-def run(wsp, perf_img, multiplier=1.0, var=False):
+def run(wsp, perf_img, multiplier=1.0, var=False, alpha=None):
     """
     Do calibration of a perfusion image from a calibration (M0) image or value
 
     :param wsp: Workspace object
     :param perf_img: Image containing perfusion data to calibrate
     :param multiplier: Scalar multiple to convert output to physical units
-    :param alpha: Inversion efficiency
+    :param alpha: Inversion efficiency. If not specified, obtained using ``get_alpha``
     :param var: If True, assume data represents variance rather than value
 
     :return: Image containing calibrated data
@@ -45,7 +45,8 @@ def run(wsp, perf_img, multiplier=1.0, var=False):
         raise ValueError("No calibration data supplied")
 
     wsp.log.write("\nCalibrating perfusion data: %s\n" % perf_img.name)
-    alpha = wsp.ifnone("calib_alpha", 1.0 if wsp.asldata.iaf in ("ve", "vediff") else 0.85 if wsp.asldata.casl else 0.98)
+    if alpha is None:
+        alpha = get_alpha(wsp)
     m0 = wsp.m0
     if isinstance(m0, Image):
         m0 = m0.data
@@ -57,19 +58,43 @@ def run(wsp, perf_img, multiplier=1.0, var=False):
         alpha = alpha**2
 
     if isinstance(m0, np.ndarray):
-        # If M0 is <= zero, make calibrated data zero
-        calibrated = np.zeros(perf_img.shape)
-        calibrated[m0 > 0] = perf_img.data[m0 > 0] / m0[m0 > 0]
+        # If M0 is <= zero, make calibrated data zero. The division is done
+        # in a single pass into the output array rather than by indexing. Single
+        # precision perfusion data (e.g. from Fabber) is kept in single precision,
+        # anything else is calibrated in double precision
+        perf_data = perf_img.data
+        dtype = np.float32 if perf_data.dtype == np.float32 else np.float64
+        calibrated = np.zeros(perf_img.shape, dtype=dtype)
+        np.divide(perf_data, m0, out=calibrated, where=m0 > 0)
     else:
         calibrated = perf_img.data / m0
 
+    # Inversion efficiency and multiplier are combined into a single in-place scaling
+    scale = 1.0
     if alpha != 1.0:
         wsp.log.write(" - Using inversion efficiency correction: %f\n" % alpha)
-        calibrated /= alpha
+        scale /= alpha
 
     if multiplier != 1.0:
         wsp.log.write(" - Using multiplier for physical units: %f\n" % multiplier)
-        calibrated *= multiplier
+        scale *= multiplier
+
+    if scale != 1.0:
+        calibrated *= scale
 
     perf_calib = Image(calibrated, name=perf_img.name, header=perf_img.header)
     return perf_calib
+
+def get_alpha(wsp):
+    """
+    Get the inversion efficiency
+
+    :param wsp: Workspace object
+    :return: User-specified ``calib_alpha`` if given, otherwise the default for the
+             labelling scheme of the ASL data
+    """
+    alpha = wsp.calib_alpha
+    if alpha is None:
+        asldata = wsp.asldata
+        alpha = 1.0 if asldata.iaf in ("ve", "vediff") else 0.85 if asldata.casl else 0.98
+    return alpha
@@ -116,6 +116,11 @@ def run(wsp):
     if not warps and moco_mats is None and wsp.senscorr is None:
         wsp.log.write(" - No corrections to apply to ASL data\n")
         wsp.corrected.asldata = wsp.preproc.asldata
+    elif not warps and wsp.senscorr is None and wsp.moco.output is not None:
+        # Motion correction is the only correction and the motion correction module
+        # has already applied the same transformation to the ASL data
+        wsp.log.write(" - Using motion corrected ASL data\n")
+        wsp.corrected.asldata = wsp.moco.output
     else:
         # Apply all corrections to ASL data - note that we make sure the output keeps all the ASL metadata
         wsp.log.write(" - Applying corrections to ASL data\n")
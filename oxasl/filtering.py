@@ -8,21 +8,13 @@ Pre-filtering processes do not depend on the type of ASL data (e.g. multiphase,
 Copyright (c) 2008-2020 Univerisity of Oxford
 """
 
-try:
-    import oxasl_enable
-except ImportError:
-    oxasl_enable = None
-
-try:
-    import oxasl_deblur
-except ImportError:
-    oxasl_deblur = None
+from oxasl.utils import get_plugin
 
 def run(wsp):
     wsp.sub("filter")
 
-    if oxasl_enable and wsp.use_enable:
-        oxasl_enable.run(wsp, output_wsp=wsp.filter)
+    if wsp.use_enable and get_plugin("oxasl_enable"):
+        get_plugin("oxasl_enable").run(wsp, output_wsp=wsp.filter)
 
-    if oxasl_deblur and wsp.deblur:
-        oxasl_deblur.run(wsp, output_wsp=wsp.filter)
+    if wsp.deblur and get_plugin("oxasl_deblur"):
+        get_plugin("oxasl_deblur").run(wsp, output_wsp=wsp.filter)
@@ -11,7 +11,6 @@ import warnings
 
 import six
 import numpy as np
-import scipy.linalg
 
 from fsl.data.image import Image
 
@@ -682,7 +681,9 @@ class AslImage(Image):
                 ctrl = tag+1
                 output_data[..., vol] = reordered[..., ctrl] - reordered[..., tag]
         elif self.iaf == "hadamard":
-            # Hadamard decoding
+            # Hadamard decoding. scipy.linalg is slow to import and only needed
+            # here so it is not imported at module level
+            import scipy.linalg
             had_matrix = scipy.linalg.hadamard(self.ntc)
             output_data = np.zeros(list(self.shape[:3]) + [(self.ntc-1)*int(self.nvols/self.ntc)])
 
@@ -659,9 +659,9 @@ def get_tissrefmask(wsp):
 
         wsp.log.write(" - Masking FAST output with standard space derived ventricle mask\n")
         wsp.refpve_pre_mask = wsp.refpve
-        refpve_data = np.copy(wsp.refpve.data)
-        refpve_data[wsp.ventricles_struc.data == 0] = 0
-        wsp.refpve = Image(refpve_data, header=wsp.refpve.header)
+        refpve = wsp.refpve
+        refpve_data = np.where(wsp.ventricles_struc.data == 0, 0, refpve.data)
+        wsp.refpve = Image(refpve_data, header=refpve.header)
         wsp.refpve_post = wsp.refpve
 
         page.heading("Structural space ventricles PVE", level=1)
@@ -65,9 +65,7 @@ def run(wsp):
         wsp.rois.mask_src = "struc"
         page.heading("Brain extracted structural image", level=1)
         page.image("struc_brain", LightboxImage(wsp.structural.brain, bgimage=wsp.structural.struc))
-        wsp.rois.mask_struc = wsp.structural.brain_mask
-        wsp.rois.mask_asl = reg.change_space(wsp, wsp.structural.brain_mask, "asl")
-        wsp.rois.mask = Image(sp.ndimage.morphology.binary_fill_holes((wsp.rois.mask_asl.data > 0.25)).astype(np.int32), header=wsp.rois.mask_asl.header)
+        wsp.rois.mask = _mask_from_struc(wsp)
         mask_source = "generated from brain extracting structural image and registering to ASL space"
     else:
         # Alternatively, use registration image (which will be BETed calibration or mean ASL image)
@@ -81,7 +79,42 @@ def run(wsp):
     page.text("Mask was %s" % mask_source)
     page.text("PW ASL image masked by ASL-space mask")
 
+    page.image("mask_outline", LightboxImage(wsp.rois.mask, bgimage=_mask_bgimage(wsp), outline=True))
+
+def update_struc_mask(wsp):
+    """
+    Regenerate a mask derived from the structural image, e.g. after the ASL->structural
+    registration has been improved
+
+    The existing ``rois`` workspace is kept and the previous mask is saved as ``mask_orig``.
+    Unlike re-running ``run`` the structural brain extraction is not added to the report again.
+    Masks from other sources are not changed
+    """
+    if wsp.rois.mask_src != "struc":
+        return
+
+    wsp.log.write("\nRegenerating ASL data mask from structural image\n")
+    wsp.rois.mask_orig = wsp.rois.mask
+    wsp.rois.mask = _mask_from_struc(wsp)
+
+    page = wsp.report.page("mask_update")
+    page.heading("Mask regeneration", level=0)
+    page.text("Mask was regenerated from brain extracted structural image using updated registration to ASL space")
+    page.image("mask_update_outline", LightboxImage(wsp.rois.mask, bgimage=_mask_bgimage(wsp), outline=True))
+
+def _mask_from_struc(wsp):
+    """
+    Generate an ASL space mask from the structural brain mask
+    """
+    wsp.rois.mask_struc = wsp.structural.brain_mask
+    wsp.rois.mask_asl = reg.change_space(wsp, wsp.structural.brain_mask, "asl")
+    return Image(sp.ndimage.morphology.binary_fill_holes((wsp.rois.mask_asl.data > 0.25)).astype(np.int32), header=wsp.rois.mask_asl.header)
+
+def _mask_bgimage(wsp):
+    """
+    Background image for displaying the mask outline in the report
+    """
     if wsp.asldata.iaf in ("diff", "tc", "ct"):
-        page.image("mask_outline", LightboxImage(wsp.rois.mask, bgimage=wsp.asldata.perf_weighted(), outline=True))
+        return wsp.asldata.perf_weighted()
     else:
-        page.image("mask_outline", LightboxImage(wsp.rois.mask, bgimage=wsp.asldata.mean(), outline=True))
+        return wsp.asldata.mean()
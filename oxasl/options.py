@@ -4,6 +4,7 @@ Classes for parsing command line options for ASL tools
 Copyright (c) 2008-2018 University of Oxford
 """
 import sys
+import re
 from optparse import OptionGroup, OptionParser, Option, OptionValueError
 from collections import defaultdict
 from copy import copy
@@ -121,18 +122,29 @@ class GenericOptions(OptionCategory):
         group.add_option("--debug", help="Debug mode - log all command output and keep all output files", action="store_true", default=False)
         return [group, ]
 
+# Matches one line of an options file: a key and an optional '=' followed by a
+# value. Whitespace and leading dashes are stripped from the captured text
+_OPTFILE_LINE = re.compile(r"^([^=\n]*)(?:=(.*))?$", re.M)
+
 def load_options_file(fname):
+    """
+    Load options from a text file
+
+    Each line should contain either an option name (which will be set to True)
+    or option=value. Leading dashes on option names are ignored.
+
+    :param fname: Filename
+    :return: Dictionary of option name to value
+    """
     options = {}
     if fname:
         with open(fname) as options_file:
-            for line in options_file:
-                keyval = line.strip().rstrip("\n").lstrip("--").split("=", 1)
-                key = keyval[0].strip()
-                if key != "":
-                    if len(keyval) == 1:
-                        options[key] = True
-                    else:
-                        options[key] = keyval[1].strip()
+            text = options_file.read()
+        for match in _OPTFILE_LINE.finditer(text):
+            key, value = match.groups()
+            key = key.strip().lstrip("-").strip()
+            if key:
+                options[key] = True if value is None else value.strip()
     return options
 
 def load_matrix(fname):
@@ -97,8 +97,14 @@ def _output_native(wsp, quantify_wsp):
     if wsp.asldata.iaf in ("tc", "ct", "diff"):
         wsp.diffdata_mean = wsp.asldata.diff().mean_across_repeats()
 
-    # Save the analysis mask
-    wsp.mask = quantify_wsp.analysis_mask
+    # Save the analysis mask. Keep the mask image for zeroing and reporting the output
+    # so it is not reloaded from the workspace for every output image
+    mask_img = quantify_wsp.analysis_mask
+    wsp.mask = mask_img
+    mask = mask_img.data != 0
+
+    # The report regions are the same for every output so find their voxels once
+    regions = _report_regions(wsp, mask_img, mask_img)
 
     # Output model fitting results
     prefixes = ["", "mean"]
@@ -106,7 +112,16 @@ def _output_native(wsp, quantify_wsp):
         prefixes.append("std")
     if wsp.output_var or wsp.region_analysis:
         prefixes.append("var")
+
+    # Look up the final fitting step and calibration workspaces once rather
+    # than for every output. Calibrated output workspaces are created on first use
+    finalstep = quantify_wsp.finalstep
+    calib_wsps = [(method, getattr(wsp.calibration, method)) for method in wsp.calibration.calib_method]
+    alpha = calibration.get_alpha(wsp)
+    calib_output_wsps = {}
+
     for fabber_name, oxasl_output in OUTPUT_ITEMS.items():
+        output_name, multiplier, calibrate, units, normal_gm, normal_wm = oxasl_output
         for prefix in prefixes:
             is_variance = prefix == "var"
             if is_variance:
@@ -120,16 +135,12 @@ def _output_native(wsp, quantify_wsp):
             else:
                 fabber_output = fabber_name
 
-            img = quantify_wsp.finalstep.ifnone(fabber_output, None)
+            img = finalstep.ifnone(fabber_output, None)
             if img is not None:
                 # Make negative/nan values = 0 and ensure masked value zeroed
                 # since quantification may use a different fitting mask to the pipeline mask
-                data = np.copy(img.data)
-                data[~np.isfinite(data)] = 0
-                data[img.data < 0] = 0
-                data[wsp.mask.data == 0] = 0
-                img = Image(data, header=img.header)
-                name, multiplier, calibrate, units, normal_gm, normal_wm = oxasl_output
+                img = Image(_zero_invalid(img.data, mask), header=img.header)
+                name = output_name
                 if prefix and prefix != "mean":
                     name = "%s_%s" % (name, prefix)
 
@@ -140,26 +151,84 @@ def _output_native(wsp, quantify_wsp):
                 setattr(wsp, name, img)
 
                 if calibrate:
-                    for method in wsp.calibration.calib_method:
+                    for method, calib_wsp in calib_wsps:
                         if method != "prequantified":
-                            calib_wsp = getattr(wsp.calibration, method)
-                            img_calib = calibration.run(calib_wsp, img, multiplier=multiplier, var=is_variance)
-                            sub_wsp_name = "calib_%s" % method
-                            calib_output_wsp = getattr(wsp, sub_wsp_name)
+                            img_calib = calibration.run(calib_wsp, img, multiplier=multiplier, var=is_variance, alpha=alpha)
+                            calib_output_wsp = calib_output_wsps.get(method)
                             if calib_output_wsp is None:
-                                calib_output_wsp = wsp.sub(sub_wsp_name)
+                                sub_wsp_name = "calib_%s" % method
+                                calib_output_wsp = getattr(wsp, sub_wsp_name)
+                                if calib_output_wsp is None:
+                                    calib_output_wsp = wsp.sub(sub_wsp_name)
+                                calib_output_wsps[method] = calib_output_wsp
                             setattr(calib_output_wsp, name, img_calib)
-                            output_report(calib_output_wsp, name, units, normal_gm, normal_wm, method)
+                            output_report(calib_output_wsp, name, units, normal_gm, normal_wm, method, regions, alpha, mask_img)
                         else:
-                            output_report(wsp, name, units, normal_gm, normal_wm, method)
+                            output_report(wsp, name, units, normal_gm, normal_wm, method, regions, alpha, mask_img)
                 else:
-                    output_report(wsp, name, units, normal_gm, normal_wm)
+                    output_report(wsp, name, units, normal_gm, normal_wm, regions=regions, mask=mask_img)
+
+def _zero_invalid(data, mask):
+    """
+    Return a copy of data with negative, non-finite and unmasked values set to zero
+
+    :param data: Numpy array, 3D or 4D
+    :param mask: 3D boolean Numpy array. Applied to every volume of 4D data
+    """
+    mask = mask.reshape(mask.shape + (1,) * (data.ndim - mask.ndim))
+    # NaN and +inf fail the second comparison, -inf fails the first
+    return np.where(mask & (data > 0) & (data < np.inf), data, 0)
+
+REPORT_ROIS = (
+    ("GM mean", "gm_asl", "gm"),
+    ("Pure GM mean", "pure_gm_asl", "gm"),
+    ("Cortical GM mean", "cortical_gm_asl", "gm"),
+    ("WM mean", "wm_asl", "wm"),
+    ("Pure WM mean", "pure_wm_asl", "wm"),
+    ("Cerebral WM mean", "cerebral_wm_asl", "wm"),
+)
+
+def _report_regions(wsp, img, mask=None):
+    """
+    Get the regions summarised in the output report
+
+    The regions overlap (e.g. pure GM is a subset of GM) so each voxel is labelled
+    by the combination of regions it is in. The sum within every region can then
+    be found from a single weighted ``np.bincount`` over the labels
 
-def output_report(wsp, name, units, normal_gm, normal_wm, calib_method="none"):
+    :param wsp: Workspace object containing output
+    :param img: Image in the space of the output data
+    :param mask: Analysis mask Image. Obtained from the workspace if not given
+    :return: Tuple of (flattened indices of voxels in any region, label index of each
+             of these voxels, number of voxels with each label, sequence of
+             (metric name, boolean array of labels in region, tissue type) tuples)
+    """
+    if mask is None:
+        mask = wsp.mask
+    roi = reg.change_space(wsp, mask, img).data
+    regions = [("Mean within mask", roi > 0.5, "")]
+    if wsp.structural.struc is not None:
+        for metric, roi_name, tissue in REPORT_ROIS:
+            regions.append((metric, getattr(wsp.rois, roi_name).data > 0, tissue))
+
+    combinations = np.zeros(roi.shape, dtype=np.int32)
+    for bit, (_metric, in_region, _tissue) in enumerate(regions):
+        combinations[in_region] |= 1 << bit
+    voxels = np.flatnonzero(combinations)
+    labels, voxel_labels = np.unique(combinations.reshape(-1).take(voxels), return_inverse=True)
+    counts = np.bincount(voxel_labels, minlength=len(labels))
+    regions = [(metric, (labels >> bit) & 1 == 1, tissue) for bit, (metric, _in_region, tissue) in enumerate(regions)]
+    return voxels, voxel_labels, counts, regions
+
+def output_report(wsp, name, units, normal_gm, normal_wm, calib_method="none", regions=None, alpha=None, mask=None):
     """
     Create report pages from output data
 
     :param wsp: Workspace object containing output
+    :param regions: Regions to report mean values within, as returned by
+                    ``_report_regions``. Calculated from the workspace if not given
+    :param alpha: Inversion efficiency used for calibration. Obtained from the workspace if not given
+    :param mask: Analysis mask Image. Obtained from the workspace if not given
     """
     report = wsp.report
 
@@ -168,28 +237,29 @@ def output_report(wsp, name, units, normal_gm, normal_wm, calib_method="none"):
         page = report.page("%s_%s" % (name, calib_method))
         page.heading("Output image: %s (calibration: %s)" % (name, calib_method))
         if calib_method != "none":
-            alpha = wsp.ifnone("calib_alpha", 1.0 if wsp.asldata.iaf in ("ve", "vediff") else 0.85 if wsp.asldata.casl else 0.98)
+            if alpha is None:
+                alpha = calibration.get_alpha(wsp)
             page.heading("Calibration", level=1)
             page.text("Calibration method: %s" % calib_method)
             page.text("Inversion efficiency: %f" % alpha)
 
         page.heading("Metrics", level=1)
-        data = img.data
-        roi = reg.change_space(wsp, wsp.mask, img).data
+        if mask is None:
+            mask = wsp.mask
+        if regions is None:
+            regions = _report_regions(wsp, img, mask)
+        voxels, voxel_labels, counts, label_regions = regions
+        sums = np.bincount(voxel_labels, weights=img.data.reshape(-1).take(voxels), minlength=len(counts))
+        normal = {"gm" : normal_gm, "wm" : normal_wm}
         table = []
-        table.append(["Mean within mask", "%.4g %s" % (np.mean(data[roi > 0.5]), units), ""])
-        if wsp.structural.struc is not None:
-            table.append(["GM mean", "%.4g %s" % (np.mean(data[wsp.rois.gm_asl.data > 0]), units), normal_gm])
-            table.append(["Pure GM mean", "%.4g %s" % (np.mean(data[wsp.rois.pure_gm_asl.data > 0]), units), normal_gm])
-            table.append(["Cortical GM mean", "%.4g %s" % (np.mean(data[wsp.rois.cortical_gm_asl.data > 0]), units), normal_gm])
-            table.append(["WM mean", "%.4g %s" % (np.mean(data[wsp.rois.wm_asl.data > 0]), units), normal_wm])
-            table.append(["Pure WM mean", "%.4g %s" % (np.mean(data[wsp.rois.pure_wm_asl.data > 0]), units), normal_wm])
-            table.append(["Cerebral WM mean", "%.4g %s" % (np.mean(data[wsp.rois.cerebral_wm_asl.data > 0]), units), normal_wm])
+        for metric, in_region, tissue in label_regions:
+            mean = np.sum(sums[in_region]) / np.sum(counts[in_region])
+            table.append([metric, "%.4g %s" % (mean, units), normal.get(tissue, "")])
 
         page.table(table, headers=["Metric", "Value", "Typical"])
 
         page.heading("Image", level=1)
-        page.image("%s_%s_img" % (name, calib_method), LightboxImage(img, zeromask=False, mask=wsp.mask, colorbar=True))
+        page.image("%s_%s_img" % (name, calib_method), LightboxImage(img, zeromask=False, mask=mask, colorbar=True))
 
 def __output_trans_helper(wsp):
     """
@@ -229,18 +299,40 @@ def _output_trans(wsp):
     if wsp.output_custom:
         output_spaces.append(("custom", "user-defined custom"))
 
+    if not output_spaces:
+        # No registration or output spaces available so the native outputs are not needed
+        return
+
+    # Native space outputs and calibration methods are the same for every output space
+    native_outputs = list(__output_trans_helper(wsp))
+    calib_methods = [method for method in wsp.calibration.calib_method if method != "prequantified"]
+
     for space, name in output_spaces:
         wsp.log.write(" - Generating output in %s space\n" % name)
         output_wsp = wsp.sub(space)
-        for suffix, output, native_data in __output_trans_helper(wsp): 
-            setattr(output_wsp, output + suffix, reg.change_space(wsp, native_data, space, mask=(output == 'mask')))
-            for method in wsp.calibration.calib_method:
-                if method != "prequantified":
-                    sub_wsp_name = "calib_%s" % method
-                    native_calib_output_wsp = getattr(wsp.native, sub_wsp_name)
-                    native_calib_data = getattr(native_calib_output_wsp, output + suffix)
-                    calib_output_wsp = output_wsp.sub(sub_wsp_name)
-                    setattr(calib_output_wsp, output + suffix, reg.change_space(wsp, native_calib_data, space, mask=(output == 'mask')))
-                else:
-                    native_data = getattr(wsp.native, output + suffix)
-                    setattr(output_wsp, output + suffix, reg.change_space(wsp, native_data, space, mask=(output == 'mask')))
+        outputs = [(output + suffix, output == "mask", native_data) for suffix, output, native_data in native_outputs]
+        _transform_outputs(wsp, output_wsp, outputs, space)
+        for method in calib_methods:
+            sub_wsp_name = "calib_%s" % method
+            native_calib_output_wsp = getattr(wsp.native, sub_wsp_name)
+            outputs = [(output + suffix, output == "mask", getattr(native_calib_output_wsp, output + suffix)) for suffix, output, _native_data in native_outputs]
+            _transform_outputs(wsp, output_wsp.sub(sub_wsp_name), outputs, space)
+
+def _transform_outputs(wsp, output_wsp, outputs, space):
+    """
+    Transform native space outputs into another space
+
+    The outputs are transformed together by a single FSL command rather than one for
+    each output. Masks are transformed separately so they are binarised and
+    do not change the data type of the other outputs
+
+    :param wsp: Workspace object
+    :param output_wsp: Workspace to save transformed outputs in
+    :param outputs: Sequence of (name, is_mask, Image) tuples. Images must be 3D and in the same space
+    :param space: Name of the output space
+    """
+    for is_mask in (False, True):
+        names = [name for name, output_is_mask, _img in outputs if output_is_mask == is_mask]
+        imgs = [img for _name, output_is_mask, img in outputs if output_is_mask == is_mask]
+        for name, img in zip(names, reg.change_space_multi(wsp, imgs, space, mask=is_mask)):
+            setattr(output_wsp, name, img)
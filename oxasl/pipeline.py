@@ -50,52 +50,26 @@ from __future__ import print_function
 
 import sys
 import os
+import gc
 import traceback
 
-# Quick-and-dirty plugin imports - to be replaced with entry points and a defined plugin api
-# at some point
-try:
-    import oxasl_ve
-except ImportError:
-    oxasl_ve = None
-
-try:
-    import oxasl_mp
-except ImportError:
-    oxasl_mp = None
-
-try:
-    import oxasl_deblur
-except ImportError:
-    oxasl_deblur = None
-
-try:
-    import oxasl_enable
-except ImportError:
-    oxasl_enable = None
-
-try:
-    import oxasl_surfpvc
-except ImportError:
-    oxasl_surfpvc = None
-
-try:
-    import oxasl_multite
-except ImportError:
-    oxasl_multite = None
-
 from oxasl import *
 from oxasl.options import AslOptionParser, GenericOptions, OptionGroup
 from oxasl.reporting import LightboxImage
+from oxasl.utils import get_plugin
+
+# Quick-and-dirty plugins - to be replaced with entry points and a defined plugin api
+# at some point. Plugins are only imported when first needed
+PLUGINS = ("oxasl_ve", "oxasl_mp", "oxasl_deblur", "oxasl_enable", "oxasl_surfpvc", "oxasl_multite")
 
 def add_options(parser):
     g = OptionGroup(parser, "General Pipeline Options")
     g.add_option("--wp", help="Analysis which conforms to the 'white papers' (Alsop et al 2014)", action="store_true", default=False)
     g.add_option("--mc", help="Motion correct data", action="store_true", default=False)
     g.add_option("--noreorient", help="Do not reorient ASL/calibration data to standard orientation", action="store_true", default=False)
-    if oxasl_enable:
+    if get_plugin("oxasl_enable"):
         g.add_option("--use-enable", help="Use ENABLE preprocessing step", action="store_true", default=False)
-    if oxasl_deblur:
+    if get_plugin("oxasl_deblur"):
         g.add_option("--deblur", help="Perform deblurring of ASL and calibration data", action="store_true", default=False)
     parser.add_option_group(g)
 
@@ -139,16 +113,11 @@ def main():
         parser.add_category(senscorr.Options())
         parser.add_category(basil.Options())
         parser.add_category(corrections.Options())
-        if oxasl_ve:
-            parser.add_category(oxasl_ve.Options())
-        if oxasl_mp:
-            parser.add_category(oxasl_mp.Options())
-        if oxasl_enable:
-            parser.add_category(oxasl_enable.Options())
-        if oxasl_multite:
-            parser.add_category(oxasl_multite.MultiTEOptions())
-        if oxasl_deblur:
-            parser.add_category(oxasl_deblur.Options())
+        for plugin_name, options_class in (("oxasl_ve", "Options"), ("oxasl_mp", "Options"), ("oxasl_enable", "Options"),
+                                           ("oxasl_multite", "MultiTEOptions"), ("oxasl_deblur", "Options")):
+            plugin = get_plugin(plugin_name)
+            if plugin:
+                parser.add_category(getattr(plugin, options_class)())
         parser.add_category(region_analysis.Options())
         parser.add_category(GenericOptions())
         parser.add_category(output.Options())
@@ -192,7 +161,7 @@ def oxasl(wsp):
     Main oxasl pipeline script
     """
     wsp.log.write("OXASL version: %s\n" % __version__)
-    for plugin in (oxasl_ve, oxasl_mp, oxasl_deblur, oxasl_enable, oxasl_surfpvc, oxasl_multite):
+    for plugin in [get_plugin(plugin_name) for plugin_name in PLUGINS]:
         if plugin is not None:
             wsp.log.write(" - Found plugin: %s (version %s)\n" % (plugin.__name__, getattr(plugin, "__version__", "unknown")))
 
@@ -287,3 +256,7 @@ def _cleanup(wsp):
         if not wsp.save_input:
             wsp.input = None
         wsp.rois = None
+
+        # Most sub-workspaces reference their parent, so removed workspaces and anything
+        # they hold in memory are only released by the cyclic garbage collector
+        gc.collect()
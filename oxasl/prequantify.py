@@ -8,13 +8,11 @@ e.g. by multiphase decoding
 Copyright (c) 2008-2020 Univerisity of Oxford
 """
 
-try:
-    import oxasl_mp
-except ImportError:
-    oxasl_mp = None
-    
+from oxasl.utils import get_plugin
+
 def run(wsp):
     if wsp.asldata.iaf == "mp":
+        oxasl_mp = get_plugin("oxasl_mp")
         if oxasl_mp is None:
             raise ValueError("Multiphase data supplied but oxasl_mp is not installed")
         wsp.sub("prequantify")
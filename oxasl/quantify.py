@@ -8,16 +8,7 @@ Copyright (c) 2008-2020 Univerisity of Oxford
 """
 
 from oxasl import basil
-
-try:
-    import oxasl_multite
-except ImportError:
-    oxasl_multite = None
-
-try:
-    import oxasl_ve
-except ImportError:
-    oxasl_ve = None
+from oxasl.utils import get_plugin
 
 def run(wsp):
     wsp.quantify_wsps = []
@@ -45,11 +36,13 @@ def _get_quantify_method(wsp):
     elif wsp.asldata.iaf in ("tc", "ct", "diff", "hadamard"):
         if wsp.asldata.ntes == 1:
             return basil.run
-        elif oxasl_multite is None:
+        oxasl_multite = get_plugin("oxasl_multite")
+        if oxasl_multite is None:
             raise ValueError("Multi-TE data supplied but oxasl_multite is not installed")
         else:
             return oxasl_multite.run
     elif wsp.asldata.iaf == "ve":
+        oxasl_ve = get_plugin("oxasl_ve")
         if oxasl_ve is None:
             raise ValueError("VE data supplied but oxasl_ve is not installed")
         else:
@@ -119,9 +119,8 @@ def get_ref_imgs(wsp, use_quantification_wsp=None):
 
     if use_quantification_wsp:
         wsp.log.write(" - ASL Registration reference image is PWI image generated by quantification\n")
-        pwi = np.copy(use_quantification_wsp.finalstep.mean_ftiss.data)
-        pwi[pwi < 0] = 0
-        wsp.reg.aslref = Image(pwi, header=use_quantification_wsp.finalstep.mean_ftiss.header)
+        mean_ftiss = use_quantification_wsp.finalstep.mean_ftiss
+        wsp.reg.aslref = Image(np.maximum(mean_ftiss.data, 0), header=mean_ftiss.header)
     elif wsp.input.aslref is not None:
         wsp.log.write(" - ASL Registration reference image supplied by user\n")
         wsp.reg.aslref = wsp.input.aslref
@@ -392,6 +391,28 @@ def change_space(wsp, img, target_space, source_space=None, **kwargs):
 
     return transform(wsp, img, tform, target_ref, **kwargs)
 
+def change_space_multi(wsp, imgs, target_space, source_space=None, **kwargs):
+    """
+    Convert a set of 3D images which are all in the same space to a different space
+
+    The images are stacked into a single 4D image so the transformation is only
+    done once rather than separately for each image. Each transformed image has
+    the data type of the corresponding input image, as it would if transformed
+    separately. Arguments are as for ``change_space``
+
+    :param imgs: Sequence of 3D Image objects in the same space
+    :return: List of transformed 3D Image objects
+    """
+    if not imgs:
+        return []
+    elif len(imgs) == 1:
+        return [change_space(wsp, imgs[0], target_space, source_space, **kwargs)]
+
+    dtype = np.result_type(*[img.dtype for img in imgs])
+    stacked = Image(np.stack([img.data for img in imgs], axis=-1).astype(dtype, copy=False), header=imgs[0].header)
+    transformed = change_space(wsp, stacked, target_space, source_space, **kwargs)
+    return [Image(transformed.data[..., idx].astype(img.dtype, copy=False), header=transformed.header) for idx, img in enumerate(imgs)]
+
 def transform(wsp, img, trans, ref, use_flirt=False, interp="trilinear", paddingsize=1, premat=None, postmat=None, mask=False, mask_thresh=0.5):
     """
     Transform an image
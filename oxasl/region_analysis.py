@@ -544,20 +544,21 @@ def run(wsp):
 
     wsp.log.write("\nRegionwise analysis\n")
 
+    # PV maps in ASL space are only resampled from structural space if they have not
+    # already been generated (e.g. by ROI generation or partial volume correction,
+    # both of which happen after the final registration). Any that are needed are
+    # resampled together
     if wsp.pvwm is not None:
         wsp.structural.wm_pv_asl = wsp.pvwm
-    else:
-        wsp.structural.wm_pv_asl = reg.change_space(wsp, wsp.structural.wm_pv, "asl")
-
-    if wsp.pvwm is not None:
         wsp.structural.gm_pv_asl = wsp.pvgm
-    else:
-        wsp.structural.gm_pv_asl = reg.change_space(wsp, wsp.structural.gm_pv, "asl")
     
     if wsp.pvcsf is not None:
         wsp.structural.csf_pv_asl = wsp.pvcsf
-    else:
-        wsp.structural.csf_pv_asl = reg.change_space(wsp, wsp.structural.csf_pv, "asl")
+
+    tissues = [tissue for tissue in ("wm", "gm", "csf") if getattr(wsp.structural, "%s_pv_asl" % tissue) is None]
+    pvs_asl = reg.change_space_multi(wsp, [getattr(wsp.structural, "%s_pv" % tissue) for tissue in tissues], "asl")
+    for tissue, pv_asl in zip(tissues, pvs_asl):
+        setattr(wsp.structural, "%s_pv_asl" % tissue, pv_asl)
 
     wsp.pure_gm_thresh, wsp.pure_wm_thresh = wsp.rois.pure_gm_thresh, wsp.rois.pure_wm_thresh
     wsp.min_gm_thresh, wsp.min_wm_thresh = wsp.ifnone("min_gm_thresh", 0.1), wsp.ifnone("min_wm_thresh", 0.1)
@@ -109,6 +109,27 @@ class LightboxImage(object):
                 return min(nonzero_slices), max(nonzero_slices)
         return 0, shape[2]-1
 
+    def _color_range(self):
+        """
+        Get the colour map and display range for the image
+
+        This is the same for every slice so it is only calculated once. Non-finite
+        values are displayed as zero so they are treated as zero here too
+
+        :return: Tuple of (colour map name, minimum value, maximum value)
+        """
+        data = self._img.data
+        if not np.all(np.isfinite(data)):
+            data = np.where(np.isfinite(data), data, 0)
+
+        if issubclass(data.dtype.type, np.integer):
+            return "Reds", np.min(data), np.max(data)
+
+        vmin, vmax = np.percentile(data, [1, 99])
+        if vmax == vmin:
+            vmin, vmax = np.min(data), np.max(data)
+        return "viridis", vmin, vmax
+
     def tofile(self, fname):
         """
         Write image to a file
@@ -134,6 +155,9 @@ class LightboxImage(object):
         num_slices = min(16, max_slice - min_slice + 1)
         grid_size = int(math.ceil(math.sqrt(num_slices)))
 
+        if self._img:
+            cmap, vmin, vmax = self._color_range()
+
         fig = Figure(figsize=(5, 5), dpi=200)
         FigureCanvas(fig)
         for nslice in range(num_slices):
@@ -151,18 +175,8 @@ class LightboxImage(object):
             if self._img:
                 data = self._img.data[:, :, slice_idx].T
                 data[~np.isfinite(data)] = 0
-
-                if issubclass(data.dtype.type, np.integer):
-                    cmap = "Reds"
-                    vmax, vmin = np.max(self._img.data), np.min(self._img.data)
-                else:
-                    cmap = "viridis"
-                    vmax, vmin = np.percentile(self._img.data, 99), np.percentile(self._img.data, 1)
-                    if vmax == vmin:
-                        vmax, vmin = np.max(self._img.data), np.min(self._img.data)
-
-                    if self._clamp_colors:
-                        data = np.clip(data, vmin, vmax)
+                if cmap == "viridis" and self._clamp_colors:
+                    data = np.clip(data, vmin, vmax)
 
                 if self._outline:
                     data = (data > 0.5).astype(np.int32)
@@ -31,8 +31,7 @@ def run(wsp):
         wsp.rois.cortex_asl = Image((cortex_asl.data > 50).astype(int), header=cortex_asl.header)
 
         if wsp.structural.gm_pv_asl is None:
-            wsp.structural.gm_pv_asl = reg.change_space(wsp, wsp.structural.gm_pv, "asl")
-            wsp.structural.wm_pv_asl = reg.change_space(wsp, wsp.structural.wm_pv, "asl")
+            wsp.structural.gm_pv_asl, wsp.structural.wm_pv_asl = reg.change_space_multi(wsp, [wsp.structural.gm_pv, wsp.structural.wm_pv], "asl")
 
         gm = np.asarray(wsp.structural.gm_pv_asl.data)
         wm = np.asarray(wsp.structural.wm_pv_asl.data)
@@ -69,15 +69,15 @@ def run(wsp):
         sensitivity = wsp.isen
     elif wsp.cact is not None and wsp.cref is not None:
         wsp.log.write(" - Sensitivity image calculated from calibration actual and reference images\n")
-        cref_data = np.copy(wsp.cref.data)
-        cref_data[cref_data == 0] = 1
+        cref_data = wsp.cref.data
+        cref_data = np.where(cref_data == 0, 1, cref_data)
         sensitivity = Image(wsp.cact.data.astype(np.float32) / cref_data, header=wsp.calib.header)
     elif wsp.calib is not None and wsp.cref is not None:
         if wsp.ifnone("mode", "longtr") != "longtr":
             raise ValueError("Calibration reference image specified but calibration image was not in longtr mode - need to provided additional calibration image using the ASL coil")
         wsp.log.write(" - Sensitivity image calculated from calibration and reference images\n")
-        cref_data = np.copy(wsp.cref.data)
-        cref_data[cref_data == 0] = 1
+        cref_data = wsp.cref.data
+        cref_data = np.where(cref_data == 0, 1, cref_data)
         sensitivity = Image(wsp.calib.data.astype(np.float32) / cref_data, header=wsp.calib.header)
     elif wsp.senscorr_auto and wsp.structural.bias is not None:
         wsp.log.write(" - Sensitivity image calculated from bias field\n")
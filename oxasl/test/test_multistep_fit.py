@@ -0,0 +1,209 @@
+"""
+Tests for BASIL multi-step fitting which do not require Fabber
+"""
+import os
+import sys
+import types
+from six import StringIO
+
+import numpy as np
+import pytest
+
+from fsl.data.image import Image
+
+from oxasl import Workspace, AslImage
+from oxasl.basil import multistep_fit
+
+def test_run_nodata():
+    """ Check we get an error if there is no data """
+    wsp = Workspace()
+    with pytest.raises(ValueError):
+        multistep_fit.run_multistep_fitting(wsp, None)
+
+def _fake_fabber(calls):
+    """
+    Stub for the Fabber wrapper which records the options of each call and
+    returns outputs containing the voxel index inside the mask and -1 outside.
+    The log contains the first voxel index in the mask
+    """
+    def _fabber(options, output=None, progress_log=None, **kwargs):
+        calls.append(options)
+        mask = options["mask"].data != 0
+        idx = np.arange(mask.size).reshape(mask.shape)
+        mvn = np.stack([idx, idx * 10], axis=-1)
+        return {
+            "mean_ftiss" : Image(np.where(mask, idx, -1).astype(np.float32)),
+            "finalMVN" : Image(np.where(mask[..., np.newaxis], mvn, -1).astype(np.float32)),
+            "paramnames" : ["ftiss"],
+            "logfile" : "log%i" % idx[mask].min() if mask.any() else "log",
+        }
+    return _fabber
+
+def test_fabber_chunked_merge(monkeypatch):
+    """ Check 3D and 4D outputs of each chunk are merged within the mask """
+    calls = []
+    monkeypatch.setattr(multistep_fit, "fabber", _fake_fabber(calls))
+    mask = np.zeros((4, 4, 4), dtype=np.int32)
+    mask[1:3, 1:3, 1:3] = 1
+    ret = multistep_fit._fabber_chunked({"mask" : Image(mask), "method" : "vb"}, 3)
+
+    assert len(calls) == 3
+    chunk_masks = [options["mask"].data != 0 for options in calls]
+    assert np.all(sum(chunk_masks) == mask)
+
+    idx = np.arange(mask.size).reshape(mask.shape)
+    assert np.all(ret["mean_ftiss"].data == np.where(mask, idx, 0))
+    assert ret["finalMVN"].shape == (4, 4, 4, 2)
+    assert np.all(ret["finalMVN"].data[..., 0] == np.where(mask, idx, 0))
+    assert np.all(ret["finalMVN"].data[..., 1] == np.where(mask, idx * 10, 0))
+    assert ret["paramnames"] == ["ftiss"]
+    assert sorted(ret["logfile"].split("\n")) == sorted(["log%i" % idx[chunk_mask].min() for chunk_mask in chunk_masks])
+
+def test_fabber_chunked_more_chunks_than_voxels(monkeypatch):
+    """ Check empty chunks are not run when there are more chunks than voxels """
+    calls = []
+    monkeypatch.setattr(multistep_fit, "fabber", _fake_fabber(calls))
+    mask = np.zeros((4, 4, 4), dtype=np.int32)
+    mask[0, 0, :3] = 1
+    ret = multistep_fit._fabber_chunked({"mask" : Image(mask), "method" : "vb"}, 8)
+
+    assert len(calls) == 3
+    idx = np.arange(mask.size).reshape(mask.shape)
+    assert np.all(ret["mean_ftiss"].data == np.where(mask, idx, 0))
+
+def test_fabber_chunked_empty_mask(monkeypatch):
+    """ Check an empty mask results in a single Fabber run """
+    calls = []
+    monkeypatch.setattr(multistep_fit, "fabber", _fake_fabber(calls))
+    mask = Image(np.zeros((4, 4, 4), dtype=np.int32))
+    ret = multistep_fit._fabber_chunked({"mask" : mask, "method" : "vb"}, 4)
+
+    assert len(calls) == 1
+    assert calls[0]["mask"] is mask
+    assert ret["logfile"] == "log"
+
+def _fake_vaby(calls):
+    """
+    Stub for the vaby module which records the options passed to each run
+    """
+    def _run(outdict, **kwargs):
+        calls.append(kwargs)
+        outdict["mean_ftiss_native"] = np.full((2, 2, 2), len(calls), dtype=np.float32)
+        outdict["posterior_native"] = np.full((2, 2, 2, 3), len(calls), dtype=np.float32)
+        return 0, None
+    return types.SimpleNamespace(run=_run)
+
+@pytest.mark.parametrize("impl, method", [("vaby", "avb"), ("svb", "svb")])
+def test_vaby_step_options(monkeypatch, impl, method):
+    """ Check the options passed to vaby for a non-spatial step followed by a spatial step """
+    calls = []
+    monkeypatch.setitem(sys.modules, "vaby", _fake_vaby(calls))
+    wsp = Workspace(basil_method=impl)
+    options = {"method" : "vb", "model" : "aslrest", "rpts" : [1, 2], "max-iterations" : 20}
+    step1 = multistep_fit.FittingStep(wsp, options, "VB")
+    options.update({
+        "method" : "spatialvb",
+        "PSP_byname1" : "ftiss", "PSP_byname1_type" : "M",
+        "PSP_byname2" : "fblood", "PSP_byname2_type" : "A",
+        "PSP_byname3" : "pvgm", "PSP_byname3_type" : "I",
+    })
+    step2 = multistep_fit.FittingStep(wsp, options, "Spatial VB")
+
+    ret1 = step1.run(None, log=StringIO())
+    ret2 = step2.run(ret1, log=StringIO())
+
+    assert len(calls) == 2
+    for kwargs in calls:
+        assert kwargs["method"] == method
+        assert kwargs["model_name"] == "aslrest"
+        assert kwargs["repeats"] == [1, 2]
+        assert kwargs["max_iterations"] == 20
+        assert "continue_from_mvn" not in kwargs
+    assert calls[0]["initial_posterior"] is None
+    assert "param_overrides" not in calls[0]
+    assert np.all(np.asanyarray(calls[1]["initial_posterior"].dataobj) == 1)
+    assert calls[1]["param_overrides"] == {"ftiss" : {"prior_type" : "M"}, "fblood" : {"prior_type" : "A"}}
+    assert np.all(ret1["mean_ftiss"].data == 1)
+    assert ret2["finalMVN"].shape == (2, 2, 2, 3)
+
+def test_step_converted_images(monkeypatch):
+    """ Check images converted for one step are re-used by steps sharing the same cache """
+    calls = []
+    def _change_space(wsp, img, space, mask=False):
+        calls.append((img, mask))
+        return Image(img.data, header=img.header)
+    monkeypatch.setattr(multistep_fit.reg, "change_space", _change_space)
+    wsp = Workspace()
+    img = Image(np.ones((2, 2, 2), dtype=np.float32))
+    converted = {}
+    step1 = multistep_fit.Step(wsp, {"data" : img, "mask" : img}, "1", converted=converted)
+    step2 = multistep_fit.Step(wsp, {"data" : img, "mask" : img}, "2", converted=converted)
+    assert calls == [(img, False), (img, True)]
+    assert step1.options["data"] is step2.options["data"]
+    assert step1.options["mask"] is step2.options["mask"]
+    assert step1.options["data"] is not step1.options["mask"]
+    assert "_converted_images" not in wsp.__dict__
+
+    multistep_fit.Step(wsp, {"data" : img}, "3")
+    assert len(calls) == 3
+
+def _identity_change_space(wsp, img, space, mask=False):
+    return img
+
+def test_fabber_input_files(monkeypatch):
+    """ Check shared input images are saved once and re-used by each step """
+    calls = []
+    def _fabber(options, output=None, progress_log=None, **kwargs):
+        calls.append(options)
+        return {"finalMVN" : Image(np.full((2, 2, 2, 3), len(calls), dtype=np.float32))}
+    monkeypatch.setattr(multistep_fit, "fabber", _fabber)
+    monkeypatch.setattr(multistep_fit.reg, "change_space", _identity_change_space)
+    wsp = Workspace()
+    options = {
+        "method" : "vb",
+        "data" : Image(np.random.rand(2, 2, 2, 4)),
+        "mask" : Image(np.ones((2, 2, 2), dtype=np.int32)),
+        "PSP_byname1" : "T_1", "PSP_byname1_type" : "I",
+        "PSP_byname1_image" : Image(np.random.rand(2, 2, 2)),
+        "tis" : [1.5, 2.0],
+    }
+    converted = {}
+    steps = [multistep_fit.FittingStep(wsp, options, "VB", converted=converted),
+             multistep_fit.FittingStep(wsp, options, "VB", converted=converted)]
+    input_files = multistep_fit.ImageFiles()
+    try:
+        ret1 = steps[0].run(None, log=StringIO(), input_files=input_files)
+        steps[1].run(ret1, log=StringIO(), input_files=input_files)
+
+        for key in ("data", "mask", "PSP_byname1_image"):
+            fname = calls[0][key]
+            assert isinstance(fname, str)
+            assert os.path.isfile(fname)
+            assert calls[1][key] == fname
+            assert np.allclose(Image(fname).data, options[key].data)
+        assert len(set(calls[0][key] for key in ("data", "mask", "PSP_byname1_image"))) == 3
+        assert "continue-from-mvn" not in calls[0]
+        assert calls[1]["continue-from-mvn"] is ret1["finalMVN"]
+        assert calls[1]["ti1"] == 1.5 and calls[1]["ti2"] == 2.0
+    finally:
+        input_files.cleanup()
+    assert not os.path.exists(os.path.dirname(fname))
+
+def test_fabber_input_files_cleanup(monkeypatch):
+    """ Check saved input images are removed if model fitting fails """
+    calls = []
+    def _fabber(options, output=None, progress_log=None, **kwargs):
+        calls.append(options)
+        raise RuntimeError("Fabber failed")
+    monkeypatch.setattr(multistep_fit, "fabber", _fabber)
+    monkeypatch.setattr(multistep_fit.reg, "change_space", _identity_change_space)
+    wsp = Workspace()
+    options = {"method" : "vb", "mask" : Image(np.ones((2, 2, 2), dtype=np.int32))}
+    monkeypatch.setattr(multistep_fit, "fitting_steps", lambda *args, **kwargs: [multistep_fit.FittingStep(wsp, options, "VB")])
+    asldata = AslImage(name="asldata", image=np.random.rand(2, 2, 2, 4), tis=[1.5], iaf="diff", order="rt")
+    with pytest.raises(RuntimeError):
+        multistep_fit.run_multistep_fitting(wsp, asldata)
+
+    fname = calls[0]["mask"]
+    assert isinstance(fname, str)
+    assert not os.path.exists(os.path.dirname(fname))
@@ -0,0 +1,48 @@
+"""
+Tests for options module
+"""
+import os
+import tempfile
+
+from oxasl.options import load_options_file
+
+def _load(text):
+    fd, fname = tempfile.mkstemp(suffix=".txt")
+    try:
+        with os.fdopen(fd, "wb") as tfile:
+            tfile.write(text.encode("utf-8"))
+        return load_options_file(fname)
+    finally:
+        os.remove(fname)
+
+def test_optfile_flags():
+    """ Check options without a value are set to True """
+    assert _load("infertiss\n  incbat  \n") == {"infertiss" : True, "incbat" : True}
+
+def test_optfile_dashes():
+    """ Check leading dashes are removed from option names but not internal dashes """
+    assert _load("--save-mean\n-max-iterations=10\n") == {"save-mean" : True, "max-iterations" : "10"}
+
+def test_optfile_values():
+    """ Check values are split at the first '=' and whitespace is removed """
+    assert _load("key=\nkey2 = a=b \n\tkey3\t=\t3\t\n") == {"key" : "", "key2" : "a=b", "key3" : "3"}
+
+def test_optfile_crlf():
+    """ Check Windows line endings """
+    assert _load("--key1=1\r\nkey2\r\nkey3 = x\r\n") == {"key1" : "1", "key2" : True, "key3" : "x"}
+
+def test_optfile_blank_lines():
+    """ Check blank lines and lines without an option name are ignored """
+    assert _load("\n   \nkey=1\n\n--\n=value\n\xa0\n") == {"key" : "1"}
+
+def test_optfile_unicode_whitespace():
+    """ Check non-ASCII whitespace is stripped """
+    assert _load("\xa0key\x1c=\xa0value\xa0\n") == {"key" : "value"}
+
+def test_optfile_long_whitespace():
+    """ Check a long run of whitespace within a line is handled """
+    assert _load("key" + " " * 10000 + "x\n") == {"key" + " " * 10000 + "x" : True}
+
+def test_optfile_none():
+    """ Check no options are loaded if no file is given """
+    assert load_options_file(None) == {}
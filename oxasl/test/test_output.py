@@ -0,0 +1,59 @@
+"""
+Tests for output module
+"""
+import numpy as np
+
+from fsl.data.image import Image
+
+from oxasl import Workspace, reg, output
+
+def _fake_change_space(calls):
+    """
+    Stand-in for reg.change_space which, like FSL, keeps the data type of the input
+    image. Masks are binarised in the same way as reg.transform
+    """
+    def _change_space(wsp, img, target_space, source_space=None, mask=False):
+        calls.append((img.shape, mask))
+        data = (img.data + 0.1).astype(img.dtype)
+        if mask:
+            data = (data > 0.5).astype(np.int32)
+        return Image(data, header=img.header)
+    return _change_space
+
+def test_change_space_multi_dtype(monkeypatch):
+    """ Check each image keeps its data type when transformed together """
+    calls = []
+    monkeypatch.setattr(reg, "change_space", _fake_change_space(calls))
+    imgs = [
+        Image(np.full((2, 2, 2), 2, dtype=np.float32)),
+        Image(np.full((2, 2, 2), 4, dtype=np.float64)),
+    ]
+    transformed = reg.change_space_multi(None, imgs, "struc")
+
+    assert calls == [((2, 2, 2, 2), False)]
+    assert [img.dtype for img in transformed] == [np.float32, np.float64]
+    assert np.allclose(transformed[0].data, 2.1)
+    assert np.allclose(transformed[1].data, 4.1)
+
+def test_transform_outputs_dtype(monkeypatch):
+    """ Check transformed outputs keep their data type and masks are binarised """
+    calls = []
+    monkeypatch.setattr(reg, "change_space", _fake_change_space(calls))
+    wsp = Workspace()
+    perfusion = np.random.rand(3, 3, 3).astype(np.float32)
+    mask = np.zeros((3, 3, 3), dtype=np.int32)
+    mask[1, 1, 1] = 1
+    outputs = [
+        ("perfusion", False, Image(perfusion)),
+        ("perfusion_var", False, Image(np.square(perfusion))),
+        ("mask", True, Image(mask)),
+    ]
+    output._transform_outputs(wsp, wsp, outputs, "struc")
+
+    assert calls == [((3, 3, 3, 2), False), ((3, 3, 3), True)]
+    assert wsp.perfusion.dtype == np.float32
+    assert wsp.perfusion_var.dtype == np.float32
+    assert np.allclose(wsp.perfusion.data, perfusion + 0.1)
+    assert wsp.mask.shape == (3, 3, 3)
+    assert wsp.mask.dtype == np.int32
+    assert np.all(wsp.mask.data == mask)
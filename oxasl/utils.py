@@ -4,8 +4,26 @@ OXASL - Misc utility functions
 Copyright (c) 2008-2020 Univerisity of Oxford
 """
 
+import importlib
+
 import six
 
+_PLUGINS = {}
+
+def get_plugin(name):
+    """
+    Get an optional plugin module, importing it on first use
+
+    :param name: Name of the plugin module, e.g. ``oxasl_ve``
+    :return: Plugin module, or None if the plugin is not installed
+    """
+    if name not in _PLUGINS:
+        try:
+            _PLUGINS[name] = importlib.import_module(name)
+        except ImportError:
+            _PLUGINS[name] = None
+    return _PLUGINS[name]
+
 class Tee(object):
     """
     Output stream which keeps a string record of everything
@@ -120,9 +120,11 @@ class Workspace(object):
             create_savedir = False
         self.set_item("savedir", savedir, save=False)
 
-        self._parent = parent
-        self._search_childs = list(search_childs)
-        self._stuff = {}
+        # Internal attributes are never saved so avoid the cost of checking
+        # the save directory for existing files
+        self.set_item("_parent", parent, save=False)
+        self.set_item("_search_childs", list(search_childs), save=False)
+        self.set_item("_stuff", {}, save=False)
         if create_savedir:
             if parent is not None:
                 warn_overwrite = not parent._overwrite_warned
@@ -130,7 +132,7 @@ class Workspace(object):
                 warn_overwrite = True
             mkdir(savedir, log=self.ifnone("log", kwargs.get("log", sys.stdout)), 
                   warn_if_exists=warn_overwrite)
-            self._overwrite_warned = True
+            self.set_item("_overwrite_warned", True, save=False)
     
         # Defaults - these can be overridden by kwargs but might be
         # already defined in parent workspace